@@ -107,79 +107,86 @@ MODEL_PRICING = {
     }
 }
 
-# Track API usage
-@router.post("/api/track-usage")
-async def track_usage(request_data: UsageData):
+# Record a single usage event in the in-memory analytics data
+def record_usage(request_data: UsageData):
     """
-    Track API usage including tokens, costs, and response times.
+    Update token usage, costs, and response times for one usage event.
     """
-    try:
-        # Extract data from request
-        model_name = request_data.model
-        feature = request_data.feature
-        input_tokens = request_data.input_tokens
-        output_tokens = request_data.output_tokens
-        response_time = request_data.response_time
-        document_size = request_data.document_size
-        
-        # Get current date for grouping
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        
-        # Initialize date entry if it doesn't exist
-        if current_date not in analytics_data["token_usage"]:
-            analytics_data["token_usage"][current_date] = {
-                "extraction": 0,
-                "generation": 0,
-                "chat": 0
-            }
-            
-        if current_date not in analytics_data["cost_data"]:
-            analytics_data["cost_data"][current_date] = {}
-            
-        if current_date not in analytics_data["response_times"]:
-            analytics_data["response_times"][current_date] = {
-                "times": [],
-                "document_sizes": []
-            }
-            
-        if current_date not in analytics_data["documents_processed"]:
-            analytics_data["documents_processed"][current_date] = 0
+    # Extract data from request
+    model_name = request_data.model
+    feature = request_data.feature
+    input_tokens = request_data.input_tokens
+    output_tokens = request_data.output_tokens
+    response_time = request_data.response_time
+    document_size = request_data.document_size
+    
+    # Get current date for grouping
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    
+    # Initialize date entry if it doesn't exist
+    if current_date not in analytics_data["token_usage"]:
+        analytics_data["token_usage"][current_date] = {
+            "extraction": 0,
+            "generation": 0,
+            "chat": 0
+        }
         
-        # Update token usage
-        if feature in analytics_data["token_usage"][current_date]:
-            analytics_data["token_usage"][current_date][feature] += input_tokens + output_tokens
-            
-        # Calculate cost based on pricing
-        model_pricing = MODEL_PRICING.get(model_name, MODEL_PRICING["default"])
-        input_cost = (input_tokens / 1000) * model_pricing["input"]
-        output_cost = (output_tokens / 1000) * model_pricing["output"]
-        total_cost = input_cost + output_cost
+    if current_date not in analytics_data["cost_data"]:
+        analytics_data["cost_data"][current_date] = {}
         
-        # Update cost data
-        if model_name not in analytics_data["cost_data"][current_date]:
-            analytics_data["cost_data"][current_date][model_name] = 0
-        analytics_data["cost_data"][current_date][model_name] += total_cost
+    if current_date not in analytics_data["response_times"]:
+        analytics_data["response_times"][current_date] = {
+            "times": [],
+            "document_sizes": []
+        }
         
-        # Update response times
-        analytics_data["response_times"][current_date]["times"].append(response_time)
+    if current_date not in analytics_data["documents_processed"]:
+        analytics_data["documents_processed"][current_date] = 0
+    
+    # Update token usage
+    if feature in analytics_data["token_usage"][current_date]:
+        analytics_data["token_usage"][current_date][feature] += input_tokens + output_tokens
         
-        # Update document sizes and count if document_size is provided
-        if document_size:
-            analytics_data["response_times"][current_date]["document_sizes"].append(document_size)
-            
-            # Update documents processed for any feature with document_size
-            analytics_data["documents_processed"][current_date] += 1
+    # Calculate cost based on pricing
+    model_pricing = MODEL_PRICING.get(model_name, MODEL_PRICING["default"])
+    input_cost = (input_tokens / 1000) * model_pricing["input"]
+    output_cost = (output_tokens / 1000) * model_pricing["output"]
+    total_cost = input_cost + output_cost
+    
+    # Update cost data
+    if model_name not in analytics_data["cost_data"][current_date]:
+        analytics_data["cost_data"][current_date][model_name] = 0
+    analytics_data["cost_data"][current_date][model_name] += total_cost
+    
+    # Update response times
+    analytics_data["response_times"][current_date]["times"].append(response_time)
+    
+    # Update document sizes and count if document_size is provided
+    if document_size:
+        analytics_data["response_times"][current_date]["document_sizes"].append(document_size)
         
-        # Update model usage
-        if model_name not in analytics_data["model_usage"]:
-            analytics_data["model_usage"][model_name] = {
-                "tokens": 0,
-                "cost": 0,
-                "response_times": []
-            }
-        analytics_data["model_usage"][model_name]["tokens"] += input_tokens + output_tokens
-        analytics_data["model_usage"][model_name]["cost"] += total_cost
-        analytics_data["model_usage"][model_name]["response_times"].append(response_time)
+        # Update documents processed for any feature with document_size
+        analytics_data["documents_processed"][current_date] += 1
+    
+    # Update model usage
+    if model_name not in analytics_data["model_usage"]:
+        analytics_data["model_usage"][model_name] = {
+            "tokens": 0,
+            "cost": 0,
+            "response_times": []
+        }
+    analytics_data["model_usage"][model_name]["tokens"] += input_tokens + output_tokens
+    analytics_data["model_usage"][model_name]["cost"] += total_cost
+    analytics_data["model_usage"][model_name]["response_times"].append(response_time)
+
+# Track API usage
+@router.post("/api/track-usage")
+async def track_usage(request_data: UsageData):
+    """
+    Track API usage including tokens, costs, and response times.
+    """
+    try:
+        record_usage(request_data)
         
         # Save analytics to file
         save_analytics_data()
@@ -191,6 +198,26 @@ async def track_usage(request_data: UsageData):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Error tracking usage: {str(e)}")
 
+# Track a batch of API usage events
+@router.post("/api/track-usage-bulk")
+async def track_usage_bulk(request_data: List[UsageData]):
+    """
+    Track several API usage events at once, saving the analytics file only once.
+    """
+    try:
+        for usage in request_data:
+            record_usage(usage)
+        
+        # Save analytics to file
+        save_analytics_data()
+            
+        return {"status": "success", "tracked": len(request_data)}
+        
+    except Exception as e:
+        print(f"Error tracking usage batch: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error tracking usage batch: {str(e)}")
+
 # Get analytics data
 @router.get("/api/analytics", response_model=AnalyticsResponse)
 async def get_analytics(
@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import process_pdf
@@ -5,8 +6,15 @@ import chat_api
 import generation_api
 import analytics_api  # Import the new analytics API module
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start and stop the background task that batches PDF usage analytics
+    await process_pdf.start_usage_worker()
+    yield
+    await process_pdf.stop_usage_worker()
+
 # Create the FastAPI app
-app = FastAPI(title="World Bank PDF Analyzer API")
+app = FastAPI(title="World Bank PDF Analyzer API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -32,7 +40,7 @@ async def root():
             "PDF Processing": ["/api/process-pdf", "/api/process-pdf-url", "/api/search-pdf"],
             "Chat": ["/api/chat"],
             "Generation": ["/api/generate", "/api/generate-bulk"],
-            "Analytics": ["/api/track-usage", "/api/analytics"]
+            "Analytics": ["/api/track-usage", "/api/track-usage-bulk", "/api/analytics"]
         }
     }
 
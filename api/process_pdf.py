@@ -1,21 +1,28 @@
 # improved_process_pdf.py - With better markdown handling for tables and analytics tracking
 from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 import tempfile
 import os
-import requests
+import asyncio
 import re
 import time
+import random
 import httpx
+import numpy as np
+from collections import OrderedDict
+from uuid import uuid4
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 # Import Mistral OCR components
 from mistralai import Mistral
-from mistralai.models import OCRResponse
+from mistralai.models import OCRResponse, SDKError
 from mistralai import DocumentURLChunk
 from dotenv import load_dotenv
 
+import analytics_api
+
 # Load environment variables
 load_dotenv()
 # Create Router instead of FastAPI app
@@ -25,11 +32,55 @@ router = APIRouter()
 MISTRAL_API_KEY = os.environ.get("MISTRAL_API_KEY")
 mistral_client = Mistral(api_key=MISTRAL_API_KEY)
 
-# Global variables to store the current processing state
-current_pdf_data = {
-    "structured_pages": [],
-    "ocr_response": None
-}
+# HTTP status codes from the Mistral API that are worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Shared client for analytics tracking so connections are pooled across requests
+_analytics_client = httpx.AsyncClient(
+    base_url="http://localhost:8000",
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+    timeout=5.0
+)
+
+# Usage events are queued and sent to the analytics API in batches by a
+# background task, keeping the network round-trip off the request path
+USAGE_BATCH_SIZE = 50
+USAGE_FLUSH_INTERVAL = 5.0  # seconds
+USAGE_SHUTDOWN_TIMEOUT = 10.0  # seconds to wait for the worker at shutdown
+_USAGE_STOP = None  # Queue sentinel telling the worker to exit
+_usage_queue: asyncio.Queue = asyncio.Queue()
+_usage_worker: Optional[asyncio.Task] = None
+
+# Processed PDFs keyed by pdf_id, least recently used first.
+# Eviction counts entries, not bytes: each entry holds the page markdown
+# (with base64 images inlined), the plain text and the search indexes, so a
+# single large PDF can take tens of MB and the 32-entry limit is not a
+# memory limit.
+MAX_PDF_CACHE_SIZE = 32
+_pdf_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+# Page fields returned to clients; the rest are search helpers kept server-side
+PUBLIC_PAGE_FIELDS = ("page_number", "markdown", "plain_text")
+
+# Precompiled patterns used by clean_plain_text
+# Images, <br> tags, links and markdown special characters are handled in a
+# single pass; the groups are dispatched in _sub below. Link text may contain
+# whole images (linked images), and special characters between "]" and "("
+# are skipped, since the old sequential passes stripped them before
+# matching links. Link text and URLs never span a <br> tag, because the old
+# passes had already turned it into a newline, which ends a link match.
+_IMG = r'!\[.*?\]\(.*?\)'
+_NOT_BR = r'(?:(?!<br\s*/?>).)'
+_RE_COMBINED = re.compile(
+    rf'({_IMG})|(<br\s*/?>)|(\[((?:{_IMG}|{_NOT_BR})*?)\][#>*_\-]*\({_NOT_BR}*?\))|([#>*_\-])'
+)
+_RE_IMG = re.compile(_IMG)
+_RE_MD_CHARS = re.compile(r'[#>*_\-]')
+_RE_WS = re.compile(r'[ \t]+')
+_RE_NL = re.compile(r'\n\s*\n')
+
+# Word tokens used for keyword search
+_RE_TOKEN = re.compile(r'\w+')
 
 # Request/Response models
 class URLInput(BaseModel):
@@ -37,6 +88,7 @@ class URLInput(BaseModel):
 
 class QueryInput(BaseModel):
     query: str
+    pdf_id: Optional[str] = None  # Required; returned by /api/process-pdf(-url)
 
 class SearchResult(BaseModel):
     text: str
@@ -48,7 +100,7 @@ class SearchResponse(BaseModel):
     results: List[SearchResult]
 
 # Function to track API usage for analytics
-async def track_api_usage(
+def track_api_usage(
     model: str,
     feature: str,
     input_tokens: int,
@@ -58,24 +110,21 @@ async def track_api_usage(
 ):
     """
     Track API usage for analytics.
+    The event is queued and sent later by the usage flush worker.
     """
+    _usage_queue.put_nowait({
+        "model": model,
+        "feature": feature,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "response_time": response_time,
+        "document_size": document_size
+    })
+
+async def send_usage_batch(batch: List[Dict[str, Any]]):
+    """Send a batch of usage events to the analytics API."""
     try:
-        # Create the payload
-        usage_data = {
-            "model": model,
-            "feature": feature,
-            "input_tokens": input_tokens,
-            "output_tokens": output_tokens,
-            "response_time": response_time,
-            "document_size": document_size
-        }
-        
-        # Make a request to the analytics API
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "http://localhost:8000/api/track-usage", 
-                json=usage_data
-            )
+        response = await _analytics_client.post("/api/track-usage-bulk", json=batch)
             
         if response.status_code != 200:
             print(f"Error tracking API usage: {response.status_code} - {response.text}")
@@ -83,6 +132,87 @@ async def track_api_usage(
     except Exception as e:
         print(f"Error tracking API usage: {str(e)}")
 
+def record_usage_locally(events: List[Dict[str, Any]]):
+    """
+    Record usage events directly in the analytics module. Used at shutdown,
+    when the server is no longer accepting HTTP requests from itself.
+    """
+    if not events:
+        return
+    try:
+        for event in events:
+            analytics_api.record_usage(analytics_api.UsageData(**event))
+        analytics_api.save_analytics_data()
+    except Exception as e:
+        print(f"Error recording API usage: {str(e)}")
+
+async def flush_usage_events():
+    """
+    Drain the usage queue, sending up to USAGE_BATCH_SIZE events at a time
+    or whatever has arrived USAGE_FLUSH_INTERVAL seconds after the first one.
+    Exits when it receives the _USAGE_STOP sentinel; events not yet sent are
+    put back on the queue for stop_usage_worker to record.
+    """
+    batch = []
+    try:
+        while True:
+            event = await _usage_queue.get()
+            if event is _USAGE_STOP:
+                return
+            batch.append(event)
+            deadline = time.monotonic() + USAGE_FLUSH_INTERVAL
+            
+            while len(batch) < USAGE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    # asyncio.timeout rather than wait_for: on Python 3.11,
+                    # wait_for can swallow a cancellation of this task
+                    async with asyncio.timeout(remaining):
+                        event = await _usage_queue.get()
+                except TimeoutError:
+                    break
+                if event is _USAGE_STOP:
+                    return
+                batch.append(event)
+            
+            pending, batch = batch, []
+            await send_usage_batch(pending)
+    finally:
+        # Hand back events not yet sent so shutdown can record them
+        for event in batch:
+            _usage_queue.put_nowait(event)
+
+async def start_usage_worker():
+    """Start the background task that sends usage events."""
+    global _usage_worker
+    _usage_worker = asyncio.create_task(flush_usage_events())
+
+async def stop_usage_worker():
+    """
+    Stop the usage worker, record any events it didn't send, and close the
+    pooled analytics client.
+    """
+    global _usage_worker
+    if _usage_worker is not None:
+        _usage_queue.put_nowait(_USAGE_STOP)
+        try:
+            # wait_for cancels the worker if it is still busy after the timeout
+            await asyncio.wait_for(_usage_worker, USAGE_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print("Usage worker did not stop in time, cancelled it")
+        _usage_worker = None
+    
+    remaining = []
+    while not _usage_queue.empty():
+        event = _usage_queue.get_nowait()
+        if event is not _USAGE_STOP:
+            remaining.append(event)
+    record_usage_locally(remaining)
+    
+    await _analytics_client.aclose()
+
 # Function to estimate token count
 def estimate_token_count(text: str) -> int:
     """
@@ -92,15 +222,11 @@ def estimate_token_count(text: str) -> int:
     if not text:
         return 0
     
-    # A rough estimate: 1 token ≈ 4 characters or 0.75 words for English text
-    word_count = len(text.split())
-    char_count = len(text)
-    
-    # Use both estimates and take the average
-    word_based_estimate = word_count / 0.75
-    char_based_estimate = char_count / 4
-    
-    return round((word_based_estimate + char_based_estimate) / 2)
+    # A rough estimate: 1 token ≈ 4 characters or 0.75 words for English text.
+    # Words are approximated by counting spaces, which avoids building a list.
+    # The average of both estimates, (chars / 4 + words * 4 / 3) / 2, is
+    # computed in integer arithmetic as (chars + words * 16 / 3) / 8.
+    return (len(text) + text.count(' ') * 16 // 3) >> 3
 
 # Estimate tokens for image/PDF content based on file size
 def estimate_image_tokens(file_size_kb: float) -> int:
@@ -114,39 +240,47 @@ def estimate_image_tokens(file_size_kb: float) -> int:
     # Additional tokens based on file size (1 token per KB as a rough estimate)
     size_based_tokens = file_size_kb
     
-    return base_tokens + size_based_tokens
+    return round(base_tokens + size_based_tokens)
 
 # Helper functions
+def _sub(match: re.Match) -> str:
+    """Replacement callback for _RE_COMBINED."""
+    if match.group(1):
+        return ''  # Markdown image
+    if match.group(2):
+        return '\n'  # <br> tag
+    if match.group(3):
+        # Markdown link: keep the text, minus any images and special characters
+        return _RE_MD_CHARS.sub('', _RE_IMG.sub('', match.group(4)))
+    return ''  # Markdown special character
+
 def clean_plain_text(markdown_str: str) -> str:
     """
     Cleans markdown string to plain text for searching while preserving content.
     """
-    # Remove markdown images
-    text = re.sub(r'!\[.*?\]\(.*?\)', '', markdown_str)
-    
-    # Replace HTML tags like <br> with newlines
-    text = re.sub(r'<br\s*/?>', '\n', text)
-    
-    # Remove markdown special characters while preserving content
-    text = re.sub(r'[#>*_\-]', '', text)
-    
-    # Remove markdown links while keeping the text
-    text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', text)
+    # Remove images, turn <br> into newlines, unwrap links and strip
+    # markdown special characters in one scan
+    text = _RE_COMBINED.sub(_sub, markdown_str)
 
     # Normalize whitespace and newlines
-    text = re.sub(r'[ \t]+', ' ', text)
-    text = re.sub(r'\n\s*\n', '\n', text)
+    text = _RE_WS.sub(' ', text)
+    text = _RE_NL.sub('\n', text)
     text = text.strip()
 
     return text
 
 def replace_images_in_markdown(markdown_str: str, images_dict: dict) -> str:
     """Replace image placeholders in markdown with base64-encoded images."""
-    for img_name, base64_str in images_dict.items():
-        markdown_str = markdown_str.replace(
-            f"![{img_name}]({img_name})", f"![{img_name}](data:image/png;base64,{base64_str})"
-        )
-    return markdown_str
+    if not images_dict:
+        return markdown_str
+    
+    # Match any "![id](id)" placeholder in a single pass
+    names = "|".join(re.escape(img_name) for img_name in images_dict)
+    pattern = re.compile(rf"!\[({names})\]\(\1\)")
+    return pattern.sub(
+        lambda m: f"![{m.group(1)}](data:image/png;base64,{images_dict[m.group(1)]})",
+        markdown_str
+    )
 
 def get_combined_markdown(ocr_response: OCRResponse) -> str:
     """
@@ -177,91 +311,172 @@ def get_combined_markdown(ocr_response: OCRResponse) -> str:
     # Join pages with a clear separator
     return "\n".join(markdowns)
 
-def get_structured_pages(ocr_response: OCRResponse) -> list:
-    """Generate structured pages with markdown and plain text."""
-    structured = []
-    for page in ocr_response.pages:
-        # Extract images if available
-        image_data = {}
-        if hasattr(page, 'images'):
-            for img in page.images:
-                image_data[img.id] = img.image_base64
-        
-        # Get markdown with images embedded
-        page_markdown = page.markdown.strip()
-        if image_data:
-            page_markdown = replace_images_in_markdown(page_markdown, image_data)
-        
-        # Generate clean plain text for searching
-        page_plain_text = clean_plain_text(page_markdown)
+def _process_one_page(page) -> dict:
+    """Build the structured entry (markdown, plain text, search fields) for one OCR page."""
+    # Extract images if available
+    image_data = {}
+    if hasattr(page, 'images'):
+        for img in page.images:
+            image_data[img.id] = img.image_base64
+    
+    # Get markdown with images embedded
+    page_markdown = page.markdown.strip()
+    if image_data:
+        page_markdown = replace_images_in_markdown(page_markdown, image_data)
+    
+    # Generate clean plain text for searching
+    page_plain_text = clean_plain_text(page_markdown)
 
-        structured.append({
-            "page_number": page.index,  # Original 0-based index
-            "markdown": page_markdown,
-            "plain_text": page_plain_text
-        })
+    return {
+        "page_number": page.index,  # Original 0-based index
+        "markdown": page_markdown,
+        "plain_text": page_plain_text,
+        "lower_words": frozenset(_RE_TOKEN.findall(page_plain_text.lower()))  # Search terms, for build_doc_term
+    }
+
+async def get_structured_pages(ocr_response: OCRResponse) -> list:
+    """
+    Generate structured pages with markdown and plain text.
+    Pages are independent, so each one is processed in a worker thread.
+    """
+    return list(await asyncio.gather(
+        *(asyncio.to_thread(_process_one_page, page) for page in ocr_response.pages)
+    ))
+
+def build_doc_term(structured_pages: list) -> Dict[str, np.ndarray]:
+    """
+    Build a binary term-document index: each word maps to the array of
+    page indices it appears on (the nonzero rows of its matrix column).
+    """
+    postings: Dict[str, list] = {}
+    for idx, page in enumerate(structured_pages):
+        for term in page["lower_words"]:
+            postings.setdefault(term, []).append(idx)
+    return {term: np.array(pages, dtype=np.intp) for term, pages in postings.items()}
+
+def score_pages(doc_term: Dict[str, np.ndarray], num_pages: int, keywords: set) -> np.ndarray:
+    """Count how many of the keywords appear on each page."""
+    postings = [doc_term[keyword] for keyword in keywords if keyword in doc_term]
+    if not postings:
+        return np.zeros(num_pages, dtype=np.intp)
+    return np.bincount(np.concatenate(postings), minlength=num_pages)
+
+def to_public_pages(structured_pages: list) -> list:
+    """Strip server-side search fields from structured pages before returning them."""
+    return [{field: page[field] for field in PUBLIC_PAGE_FIELDS} for page in structured_pages]
+
+def store_pdf_data(pdf_data: Dict[str, Any]) -> str:
+    """Cache a processed PDF under a new pdf_id, evicting the least recently used ones."""
+    pdf_id = uuid4().hex
+    _pdf_cache[pdf_id] = pdf_data
+    
+    while len(_pdf_cache) > MAX_PDF_CACHE_SIZE:
+        oldest_id, _ = _pdf_cache.popitem(last=False)
+        print(f"Removing {oldest_id} from PDF cache")
     
-    return structured
+    return pdf_id
 
-async def process_pdf_with_mistral_ocr(file_path: str, filename: str = "document.pdf"):
-    """Process a PDF file with Mistral OCR and return structured pages."""
-    global current_pdf_data
+def get_pdf_data(pdf_id: Optional[str]) -> Dict[str, Any]:
+    """
+    Get a processed PDF from the cache and mark it as recently used.
+    A pdf_id is required so one client never searches another's document.
+    """
+    if not pdf_id:
+        raise ValueError("pdf_id is required; process the PDF first to get one")
+    
+    if pdf_id not in _pdf_cache:
+        raise ValueError(f"Unknown or expired pdf_id: {pdf_id}")
     
+    _pdf_cache.move_to_end(pdf_id)
+    return _pdf_cache[pdf_id]
+
+async def _with_retry(fn, *, attempts: int = 4, base: float = 0.5):
+    """
+    Call fn, retrying transient Mistral API failures (rate limits, 5xx and
+    connection errors) with exponential backoff and jitter.
+    Other errors, and the last failed attempt, are raised to the caller.
+    """
+    for attempt in range(attempts):
+        try:
+            return fn()
+        except (SDKError, httpx.TransportError) as e:
+            retryable = (
+                isinstance(e, httpx.TransportError)
+                or e.status_code in RETRYABLE_STATUS_CODES
+            )
+            if not retryable or attempt == attempts - 1:
+                raise
+            
+            delay = base * 2 ** attempt + random.random() * 0.1
+            print(f"Mistral API call failed ({str(e)}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+async def process_pdf_with_mistral_ocr(file_path: str, filename: str = "document.pdf"):
+    """Process a PDF file with Mistral OCR and return its pdf_id and structured pages."""
     # Start timing
     start_time = time.time()
     
-    # Clear previous data
-    current_pdf_data = {
-        "structured_pages": [],
-        "ocr_response": None
-    }
-    
-    # Read the PDF file
+    # Locate the PDF file
     pdf_file = Path(file_path)
     file_size_kb = pdf_file.stat().st_size / 1024
     
     try:
-        # Upload PDF file to Mistral's OCR service
-        uploaded_file = mistral_client.files.upload(
-            file={
-                "file_name": filename,
-                "content": pdf_file.read_bytes(),
-            },
-            purpose="ocr",
-        )
+        # Upload PDF file to Mistral's OCR service, streaming it from disk
+        # rather than reading the whole file into memory first
+        with pdf_file.open("rb") as pdf_stream:
+            def upload():
+                # Rewind in case a previous attempt consumed the stream
+                pdf_stream.seek(0)
+                return mistral_client.files.upload(
+                    file={
+                        "file_name": filename,
+                        "content": pdf_stream,
+                    },
+                    purpose="ocr",
+                )
+            
+            uploaded_file = await _with_retry(upload)
 
         # Get URL for the uploaded file
-        signed_url = mistral_client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
+        signed_url = await _with_retry(
+            lambda: mistral_client.files.get_signed_url(file_id=uploaded_file.id, expiry=1)
+        )
 
         # Process PDF with OCR, including embedded images
-        ocr_response = mistral_client.ocr.process(
-            document=DocumentURLChunk(document_url=signed_url.url),
-            model="mistral-ocr-latest",
-            include_image_base64=True
+        ocr_response = await _with_retry(
+            lambda: mistral_client.ocr.process(
+                document=DocumentURLChunk(document_url=signed_url.url),
+                model="mistral-ocr-latest",
+                include_image_base64=True
+            )
         )
         
         # Calculate response time
         response_time = time.time() - start_time
         
-        # Store the OCR response
-        current_pdf_data["ocr_response"] = ocr_response
-        
         # Generate structured pages
-        structured_pages = get_structured_pages(ocr_response)
+        structured_pages = await get_structured_pages(ocr_response)
+        
+        # Build the search index off the event loop as well
+        doc_term = await asyncio.to_thread(build_doc_term, structured_pages)
         
-        # Store structured pages
-        current_pdf_data["structured_pages"] = structured_pages
+        # Cache the structured pages and search indexes. The raw OCR response
+        # isn't kept: its base64 images are already inlined in the markdown
+        pdf_id = store_pdf_data({
+            "structured_pages": structured_pages,
+            "doc_term": doc_term,
+            "page_index": {page["page_number"]: page for page in structured_pages}
+        })
         
         # Estimate tokens
         # Input tokens are based on file size
         input_tokens = estimate_image_tokens(file_size_kb)
         
         # Output tokens are based on the extracted text
-        all_text = " ".join([page["plain_text"] for page in structured_pages])
-        output_tokens = estimate_token_count(all_text)
+        output_tokens = sum(estimate_token_count(page["plain_text"]) for page in structured_pages)
         
         # Track API usage for analytics
-        await track_api_usage(
+        track_api_usage(
             model="mistral-ocr-latest",
             feature="extraction",
             input_tokens=input_tokens,
@@ -270,7 +485,7 @@ async def process_pdf_with_mistral_ocr(file_path: str, filename: str = "document
             document_size=file_size_kb
         )
         
-        return structured_pages
+        return pdf_id, structured_pages
     
     except Exception as e:
         print(f"Error in OCR processing: {str(e)}")
@@ -304,62 +519,62 @@ def find_page_number(chunk_text: str, structured_pages: list) -> int:
     
     return best_match
 
-async def retrieve_relevant_content(query: str, top_k: int = 3):
+async def retrieve_relevant_content(query: str, pdf_id: Optional[str], top_k: int = 3):
     """
     Retrieve top-k relevant chunks based on simple keyword matching.
     This is a mock implementation without vector search.
     """
-    global current_pdf_data
-    
     # Start timing
     start_time = time.time()
     
-    if not current_pdf_data["structured_pages"]:
-        raise ValueError("No PDF has been processed yet")
-    
-    structured_pages = current_pdf_data["structured_pages"]
+    pdf_data = get_pdf_data(pdf_id)
+    structured_pages = pdf_data["structured_pages"]
+    if not structured_pages:
+        raise ValueError("The processed PDF has no pages")
     
     # Break query into keywords
-    keywords = set(query.lower().split())
+    keywords = set(_RE_TOKEN.findall(query.lower()))
     
-    # Score each page based on keyword matches
-    scored_pages = []
-    for page in structured_pages:
-        page_text = page["plain_text"].lower()
-        
-        # Calculate base score based on keyword matches
-        base_score = sum(1 for keyword in keywords if keyword in page_text)
-        
-        if base_score > 0:
-            # Calculate normalized score (0-1)
-            normalized_score = base_score / len(keywords)
-            
-            # Scale score to a more realistic range (0.4-0.9)
-            # This gives more varied percentages when displayed
-            adjusted_score = 0.4 + (normalized_score * 0.5)
-            
-            # Add small random variation to make scores look more realistic
-            import random
-            final_score = min(0.95, adjusted_score + random.uniform(-0.05, 0.05))
-            
-            scored_pages.append({
-                "text": page["plain_text"][:200] + "...",  # Extract a preview
-                "score": final_score,  # Use the adjusted score
-                "page_number": page["page_number"]
-            })
+    # Calculate base scores for all pages at once from the term-document index
+    base_scores = score_pages(pdf_data["doc_term"], len(structured_pages), keywords)
+    
+    # Score the pages that matched at least one keyword
+    matched = np.flatnonzero(base_scores)
+    
+    # Calculate normalized score (0-1)
+    normalized_scores = base_scores[matched] / len(keywords)
+    
+    # Scale score to a more realistic range (0.4-0.9)
+    # This gives more varied percentages when displayed
+    adjusted_scores = 0.4 + (normalized_scores * 0.5)
     
-    # Sort by score and take top_k
-    scored_pages.sort(key=lambda x: x["score"], reverse=True)
-    top_results = scored_pages[:top_k]
+    # Add small random variation to make scores look more realistic
+    jitter = np.random.uniform(-0.05, 0.05, size=adjusted_scores.shape)
+    final_scores = np.minimum(0.95, adjusted_scores + jitter)
+    
+    # Select the top_k scores in O(n), then sort only those
+    if top_k < len(final_scores):
+        top = np.argpartition(-final_scores, top_k - 1)[:top_k]
+    else:
+        top = np.arange(len(final_scores))
+    top = top[np.argsort(-final_scores[top], kind="stable")]
+    
+    top_results = []
+    for i in top:
+        page = structured_pages[matched[i]]
+        top_results.append({
+            "text": page["plain_text"][:200] + "...",  # Extract a preview
+            "score": float(final_scores[i]),  # Use the adjusted score
+            "page_number": page["page_number"]
+        })
     
     # Enhance results with full markdown content
+    page_index = pdf_data["page_index"]
     results = []
     for result in top_results:
         page_number = result["page_number"]
-        markdown = next(
-            (page["markdown"] for page in structured_pages if page["page_number"] == page_number),
-            "Markdown content not found."
-        )
+        page = page_index.get(page_number)
+        markdown = page["markdown"] if page else "Markdown content not found."
         
         results.append({
             "text": result["text"],
@@ -376,7 +591,7 @@ async def retrieve_relevant_content(query: str, top_k: int = 3):
     output_tokens = sum([estimate_token_count(result["text"]) for result in results])
     
     # Track API usage
-    await track_api_usage(
+    track_api_usage(
         model="semantic-search",  # This is a placeholder, replace with actual model name if relevant
         feature="extraction",
         input_tokens=input_tokens,
@@ -390,43 +605,46 @@ async def retrieve_relevant_content(query: str, top_k: int = 3):
 @router.get("/api/debug")
 async def debug_info():
     """Get debug information about the current state."""
-    global current_pdf_data
+    latest = _pdf_cache[next(reversed(_pdf_cache))] if _pdf_cache else None
     return {
-        "has_structured_pages": len(current_pdf_data["structured_pages"]) > 0,
-        "num_pages": len(current_pdf_data["structured_pages"]),
-        "has_ocr_response": current_pdf_data["ocr_response"] is not None
+        "num_cached_pdfs": len(_pdf_cache),
+        "has_structured_pages": bool(latest and latest["structured_pages"]),
+        "num_pages": len(latest["structured_pages"]) if latest else 0,
+        "has_ocr_response": latest is not None
     }
 
-@router.post("/api/process-pdf")
+@router.post("/api/process-pdf", response_class=ORJSONResponse)
 async def api_process_pdf(file: UploadFile = File(...)):
     """Process a PDF file uploaded by the user."""
     try:
         print(f"Processing uploaded file: {file.filename}")
         
-        # Save the uploaded file temporarily
+        # Save the uploaded file temporarily, 1 MB at a time
+        file_size_kb = 0
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            content = await file.read()
-            temp_file.write(content)
+            while chunk := await file.read(1 << 20):
+                temp_file.write(chunk)
+                file_size_kb += len(chunk) / 1024
             temp_file_path = temp_file.name
-            file_size_kb = len(content) / 1024
         
         # Start timing
         start_time = time.time()
         
         # Process the PDF with Mistral OCR
-        structured_pages = await process_pdf_with_mistral_ocr(temp_file_path, file.filename)
+        pdf_id, structured_pages = await process_pdf_with_mistral_ocr(temp_file_path, file.filename)
         
         # Clean up the temporary file
         os.unlink(temp_file_path)
         
-        # Return the result
-        return {"status": "success", "structured_pages": structured_pages}
+        # Return the result, serialized directly with orjson since the
+        # structured pages can be tens of MB of markdown
+        return ORJSONResponse({"status": "success", "pdf_id": pdf_id, "structured_pages": to_public_pages(structured_pages)})
     
     except Exception as e:
         print(f"Error processing PDF: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/api/process-pdf-url")
+@router.post("/api/process-pdf-url", response_class=ORJSONResponse)
 async def api_process_pdf_url(data: URLInput):
     """Process a PDF file from a URL."""
     try:
@@ -435,37 +653,38 @@ async def api_process_pdf_url(data: URLInput):
         # Start timing
         start_time = time.time()
         
-        # Download the PDF from URL
-        response = requests.get(data.url, stream=True)
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Failed to download PDF from URL: {response.status_code}")
-        
         # Extract filename from URL or use default
         filename = os.path.basename(data.url) or "document.pdf"
         
-        # Save the downloaded file temporarily
-        file_size_kb = 0
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            for chunk in response.iter_content(chunk_size=8192):
-                temp_file.write(chunk)
-                file_size_kb += len(chunk) / 1024
-            temp_file_path = temp_file.name
+        # Download the PDF from URL without blocking the event loop
+        async with httpx.AsyncClient(timeout=60, follow_redirects=True) as client:
+            async with client.stream("GET", data.url) as response:
+                if response.status_code != 200:
+                    raise HTTPException(status_code=400, detail=f"Failed to download PDF from URL: {response.status_code}")
+                
+                # Save the downloaded file temporarily
+                file_size_kb = 0
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+                    async for chunk in response.aiter_bytes(8192):
+                        temp_file.write(chunk)
+                        file_size_kb += len(chunk) / 1024
+                    temp_file_path = temp_file.name
         
         # Process the PDF with Mistral OCR
-        structured_pages = await process_pdf_with_mistral_ocr(temp_file_path, filename)
+        pdf_id, structured_pages = await process_pdf_with_mistral_ocr(temp_file_path, filename)
         
         # Clean up the temporary file
         os.unlink(temp_file_path)
         
-        # Return the result
-        return {"status": "success", "structured_pages": structured_pages}
+        # Return the result, serialized directly with orjson since the
+        # structured pages can be tens of MB of markdown
+        return ORJSONResponse({"status": "success", "pdf_id": pdf_id, "structured_pages": to_public_pages(structured_pages)})
     
     except Exception as e:
         print(f"Error processing PDF from URL: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/api/search-pdf", response_model=SearchResponse)
+@router.post("/api/search-pdf", response_model=SearchResponse, response_class=ORJSONResponse)
 async def api_search_pdf(data: QueryInput):
     """Search within the processed PDF."""
     try:
@@ -474,11 +693,8 @@ async def api_search_pdf(data: QueryInput):
         # Start timing
         start_time = time.time()
         
-        if not current_pdf_data["structured_pages"]:
-            raise HTTPException(status_code=400, detail="No PDF has been processed yet")
-        
-        # Retrieve relevant chunks
-        results = await retrieve_relevant_content(data.query, top_k=3)
+        # Retrieve relevant chunks (raises ValueError if the PDF isn't cached)
+        results = await retrieve_relevant_content(data.query, data.pdf_id, top_k=3)
         
         # Calculate response time
         response_time = time.time() - start_time
@@ -488,7 +704,7 @@ async def api_search_pdf(data: QueryInput):
         output_tokens = sum([estimate_token_count(result["text"]) for result in results])
         
         # Track API usage
-        await track_api_usage(
+        track_api_usage(
             model="pdf-search",
             feature="extraction",
             input_tokens=input_tokens, 
@@ -42,6 +42,8 @@ const ExtractionSection: React.FC = () => {
   const [error, setError] = useState<string | null>(null);
   const [isSearching, setIsSearching] = useState(false);
   const [structuredPages, setStructuredPages] = useState<StructuredPage[]>([]);
+  // Server-side cache id of the processed PDF, used to scope searches
+  const [pdfId, setPdfId] = useState<string | null>(null);
   
   // Set to false to hide debug info in production
   const showDebugInfo = false;
@@ -62,21 +64,25 @@ const ExtractionSection: React.FC = () => {
       localStorage.removeItem('pdfMarkdownContent');
       localStorage.removeItem('pdfExtractedText');
       localStorage.removeItem('pdfStructuredPages');
+      localStorage.removeItem('pdfId');
       
       // Reset states
       setExtractedText(null);
       setMarkdownContent(null);
       setStructuredPages([]);
+      setPdfId(null);
       setSearchResults([]);
     } else {
       // Retrieve stored PDF data when component mounts if we have a valid session
       const storedMarkdown = localStorage.getItem('pdfMarkdownContent');
       const storedText = localStorage.getItem('pdfExtractedText');
       const storedPages = localStorage.getItem('pdfStructuredPages');
+      const storedPdfId = localStorage.getItem('pdfId');
       
       if (storedMarkdown && storedText) {
         setMarkdownContent(storedMarkdown);
         setExtractedText(storedText);
+        setPdfId(storedPdfId);
         if (storedPages) {
           try {
             setStructuredPages(JSON.parse(storedPages));
@@ -94,8 +100,11 @@ const ExtractionSection: React.FC = () => {
       localStorage.setItem('pdfMarkdownContent', markdownContent);
       localStorage.setItem('pdfExtractedText', extractedText || '');
       localStorage.setItem('pdfStructuredPages', JSON.stringify(structuredPages));
+      if (pdfId) {
+        localStorage.setItem('pdfId', pdfId);
+      }
     }
-  }, [markdownContent, extractedText, structuredPages, sessionKey]);
+  }, [markdownContent, extractedText, structuredPages, pdfId, sessionKey]);
 
   const handleUpload = () => {
     setShowUploadModal(true);
@@ -112,6 +121,7 @@ const ExtractionSection: React.FC = () => {
       setMarkdownContent(null);
       setSearchResults([]);
       setStructuredPages([]);
+      setPdfId(null);
       console.log(`Processing ${file ? 'file' : 'URL'}: ${file?.name || url}`);
       
       let response;
@@ -142,6 +152,7 @@ const ExtractionSection: React.FC = () => {
         
         // Store structured pages for search result processing
         setStructuredPages(pages);
+        setPdfId(response.data.pdf_id ?? null);
         
         // Combine all pages' content
         const combinedPlainText = pages.map(page => 
@@ -181,11 +192,20 @@ const ExtractionSection: React.FC = () => {
   const handleSearch = async () => {
     if (!searchQuery.trim() || !extractedText || structuredPages.length === 0) return;
     
+    // Searches are scoped to the server-side copy of this PDF
+    if (!pdfId) {
+      setError('Please process the PDF again to search it.');
+      return;
+    }
+    
     try {
       setIsSearching(true);
       console.log('Searching for:', searchQuery);
       
-      const response = await axios.post(`${API_BASE_URL}/api/search-pdf`, { query: searchQuery });
+      const response = await axios.post(`${API_BASE_URL}/api/search-pdf`, {
+        query: searchQuery,
+        pdf_id: pdfId
+      });
       console.log('Search response:', response.data);
       
       if (response.data.results) {
@@ -197,6 +217,9 @@ const ExtractionSection: React.FC = () => {
       console.error('Error searching PDF:', err);
       if (err.response) {
         console.error('Error response:', err.response.data);
+        if (err.response.status === 400) {
+          setError(`Search failed: ${err.response.data.detail}`);
+        }
       }
       setSearchResults([]);
     } finally {
@@ -216,6 +239,7 @@ const ExtractionSection: React.FC = () => {
     setExtractedText(null);
     setMarkdownContent(null);
     setStructuredPages([]);
+    setPdfId(null);
     setSearchResults([]);
     setSearchQuery('');
     setError(null);
@@ -224,6 +248,7 @@ const ExtractionSection: React.FC = () => {
     localStorage.removeItem('pdfMarkdownContent');
     localStorage.removeItem('pdfExtractedText');
     localStorage.removeItem('pdfStructuredPages');
+    localStorage.removeItem('pdfId');
   };
 
   // Function to render markdown content, preserving tables
@@ -14,6 +14,7 @@ interface StructuredPage {
 
 interface ProcessPdfResponse {
   status: string;
+  pdf_id: string;
   structured_pages: StructuredPage[];
 }
 
@@ -288,9 +289,9 @@ export const chatWithPdf = async (
 };
 
 // PDF Search
-export const searchPdf = async (query: string): Promise<SearchResponse> => {
+export const searchPdf = async (query: string, pdfId: string): Promise<SearchResponse> => {
   try {
-    const response = await apiClient.post<SearchResponse>('/api/search-pdf', { query });
+    const response = await apiClient.post<SearchResponse>('/api/search-pdf', { query, pdf_id: pdfId });
     return response.data;
   } catch (error) {
     console.error('Error searching PDF:', error);
@@ -316,8 +317,8 @@ export const safeProcessPdf = (file: File) =>
 export const safeProcessPdfUrl = (url: string) => 
   apiWrapper(() => processPdfUrl(url), 'Error processing PDF from URL');
 
-export const safeSearchPdf = (query: string) => 
-  apiWrapper(() => searchPdf(query), 'Error searching PDF');
+export const safeSearchPdf = (query: string, pdfId: string) => 
+  apiWrapper(() => searchPdf(query, pdfId), 'Error searching PDF');
 
 export const safeChatWithPdf = (model: string, messages: ChatMessage[], context?: string) => 
   apiWrapper(() => chatWithPdf(model, messages, context), 'Error in chat conversation');